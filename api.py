@@ -4,17 +4,39 @@ FastAPI app with minimal endpoints.
 This module is imported and launched by app.py in a background thread.
 """
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import contextlib
+import functools
+
+import anyio.to_thread
+from fastapi import FastAPI, HTTPException, Request, Response
+import orjson
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
-from world_engine import generate_world, suggest_event, apply_update
-from storage import list_snapshots, rollback_to
+from typing import Any, Dict, Iterator, List
+from world_engine import generate_world, suggest_event, apply_update, export_world, recover_latest_world
+from storage import create_snapshot, iter_snapshots, rollback_to
 from validator import validate_update, ValidationErrorDetail
+import state
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # updates since the last checkpoint live only in the journal; rebuild
+    # the latest world (newest snapshot + journal replay) on startup so a
+    # restart doesn't silently drop them
+    if state.get_world() is None:
+        world = await anyio.to_thread.run_sync(recover_latest_world)
+        if world is not None:
+            state.set_world(world)
+    yield
 
-app = FastAPI(title="Lightweight World Backend")
+app = FastAPI(title="Lightweight World Backend", default_response_class=ORJSONResponse, lifespan=lifespan)
 
-# Basic in-memory current world (for demo)
-CURRENT_WORLD: Dict[str, Any] = {}
+# World state lives in the shared state module, so the Streamlit UI and
+# the API (when both run in one process) see the same object; mutating
+# endpoints serialize on world_lock so concurrent requests can't race on
+# the same dict.
+app.state.world_lock = asyncio.Lock()
 
 class GenerateWorldRequest(BaseModel):
     name: str = "MyWorld"
@@ -29,55 +51,117 @@ class UpdateRequest(BaseModel):
 class RollbackRequest(BaseModel):
     snapshot_id: str
 
+class BatchUpdateRequest(BaseModel):
+    updates: List[Dict[str, Any]] = []
+
+def _world_response(payload: Dict[str, Any]) -> Response:
+    """
+    Serialize a world-bearing payload to bytes immediately. export_world
+    returns shallow views of the live engine dicts, so callers must
+    build the response while still holding world_lock — deferring to the
+    response class would serialize after the lock is released, racing
+    concurrent mutations.
+    """
+    return Response(content=orjson.dumps(payload), media_type="application/json")
+
 @app.post("/generate/world")
-def api_generate_world(req: GenerateWorldRequest):
-    global CURRENT_WORLD
-    world = generate_world(name=req.name, regions_count=req.regions_count, cities_per_region=req.cities_per_region)
-    CURRENT_WORLD = world
-    return {"ok": True, "world": world}
+async def api_generate_world(req: GenerateWorldRequest, request: Request):
+    async with request.app.state.world_lock:
+        # generate_world writes the initial snapshot to disk; keep that off the event loop
+        world = await anyio.to_thread.run_sync(
+            functools.partial(generate_world, name=req.name, regions_count=req.regions_count, cities_per_region=req.cities_per_region)
+        )
+        state.set_world(world)
+        return _world_response({"ok": True, "world": export_world(world)})
 
 @app.post("/generate/event")
-def api_generate_event():
-    global CURRENT_WORLD
-    if not CURRENT_WORLD:
-        raise HTTPException(status_code=400, detail="No current world. Generate one first.")
-    ev = suggest_event(CURRENT_WORLD)
+async def api_generate_event(request: Request):
+    # suggest_event iterates the world's dicts and writes its memoized
+    # name cache, so even this read-ish path takes the lock — a worker
+    # thread applying an update could resize those dicts mid-iteration
+    async with request.app.state.world_lock:
+        world = state.get_world()
+        if not world:
+            raise HTTPException(status_code=400, detail="No current world. Generate one first.")
+        ev = suggest_event(world)
     return {"ok": True, "event": ev}
 
 @app.post("/validate")
-def api_validate(update: Dict[str, Any]):
-    global CURRENT_WORLD
-    if not CURRENT_WORLD:
-        raise HTTPException(status_code=400, detail="No current world to validate against")
-    try:
-        out = validate_update(CURRENT_WORLD, update)
-        return {"ok": True, "result": out}
-    except ValidationErrorDetail as e:
-        raise HTTPException(status_code=400, detail={"message": str(e), "details": getattr(e, "details", None)})
+async def api_validate(update: Dict[str, Any], request: Request, strict: bool = False):
+    # validation reads the live world dicts, so hold the lock against
+    # concurrent mutation (cheap: O(|update|) unless strict)
+    async with request.app.state.world_lock:
+        world = state.get_world()
+        if not world:
+            raise HTTPException(status_code=400, detail="No current world to validate against")
+        try:
+            out = validate_update(world, update, strict=strict)
+        except ValidationErrorDetail as e:
+            raise HTTPException(status_code=400, detail={"message": str(e), "details": getattr(e, "details", None)})
+    return {"ok": True, "result": out}
 
 @app.post("/apply-update")
-def api_apply_update(update: Dict[str, Any]):
-    global CURRENT_WORLD
-    if not CURRENT_WORLD:
-        raise HTTPException(status_code=400, detail="No current world to apply updates")
-    res = apply_update(CURRENT_WORLD, update, snapshot=True)
-    if not res.get("ok"):
-        raise HTTPException(status_code=400, detail=res.get("error", "apply failed"))
-    # ensure CURRENT_WORLD updated by reference
-    CURRENT_WORLD = res["world"]
-    return {"ok": True, "world": CURRENT_WORLD}
+async def api_apply_update(update: Dict[str, Any], request: Request):
+    async with request.app.state.world_lock:
+        world = state.get_world()
+        if not world:
+            raise HTTPException(status_code=400, detail="No current world to apply updates")
+        # apply_update journals to disk on success; run it in a worker thread
+        res = await anyio.to_thread.run_sync(apply_update, world, update)
+        if not res.get("ok"):
+            raise HTTPException(status_code=400, detail=res.get("error", "apply failed"))
+        state.set_world(res["world"])
+        return _world_response({"ok": True, "world": export_world(res["world"])})
+
+@app.post("/apply-updates")
+async def api_apply_updates(req: BatchUpdateRequest, request: Request):
+    """
+    Apply a burst of updates under one lock acquisition and cut a single
+    checkpoint snapshot at the end instead of persisting per op.
+    Partial failures are reported per update.
+    """
+    async with request.app.state.world_lock:
+        world = state.get_world()
+        if not world:
+            raise HTTPException(status_code=400, detail="No current world to apply updates")
+
+        def _apply_all(world, updates):
+            results = []
+            applied = 0
+            for up in updates:
+                res = apply_update(world, up, snapshot=False)
+                if res.get("ok"):
+                    applied += 1
+                    results.append({"ok": True})
+                else:
+                    results.append({"ok": False, "error": res.get("error"), "details": res.get("details")})
+            snapshot_id = create_snapshot(world, tag=f"batch:{applied}") if applied else None
+            return results, snapshot_id
+
+        results, snapshot_id = await anyio.to_thread.run_sync(_apply_all, world, req.updates)
+        return _world_response({"ok": True, "results": results, "snapshot_id": snapshot_id, "world": export_world(world)})
+
+def _snapshot_lines() -> Iterator[bytes]:
+    for snap in iter_snapshots():
+        yield orjson.dumps(snap) + b"\n"
 
 @app.get("/snapshots")
-def api_snapshots():
-    snaps = list_snapshots()
-    return {"ok": True, "snapshots": snaps}
+async def api_snapshots():
+    """
+    Stream the snapshot listing as NDJSON, one line per snapshot in
+    directory order. Serialization overlaps with the socket sends and
+    memory stays at one line regardless of how many snapshots exist;
+    Starlette iterates the sync generator in its threadpool, so the
+    scandir stays off the event loop.
+    """
+    return StreamingResponse(_snapshot_lines(), media_type="application/x-ndjson")
 
 @app.post("/rollback")
-def api_rollback(req: RollbackRequest):
-    global CURRENT_WORLD
-    try:
-        world = rollback_to(req.snapshot_id)
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Snapshot not found")
-    CURRENT_WORLD = world
-    return {"ok": True, "world": CURRENT_WORLD}
+async def api_rollback(req: RollbackRequest, request: Request):
+    async with request.app.state.world_lock:
+        try:
+            world = await anyio.to_thread.run_sync(rollback_to, req.snapshot_id)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Snapshot not found")
+        state.set_world(world)
+        return _world_response({"ok": True, "world": export_world(world)})
@@ -1,39 +1,112 @@
 # app.py
 """
-Streamlit UI that starts a FastAPI server in background.
+Streamlit UI calling the world engine directly (same process).
 Main file for Streamlit Cloud deployment.
+The FastAPI server is only needed for external clients; set RUN_API=1
+to start it in a background thread.
 """
 
 import streamlit as st
 import threading
-import uvicorn
-import time
-from api import app as fastapi_app
-from data_loader import ensure_cities_dataset
-from api import CURRENT_WORLD  # note: reading/updating in endpoints will update this module-level object
-import requests
+import os
 import json
-from pathlib import Path
 
-# ensure data ready
-ensure_cities_dataset()
+from data_loader import ensure_cities_dataset
+from world_engine import generate_world, suggest_event, apply_update, export_world, recover_latest_world
+from storage import list_snapshots, rollback_to
+from validator import validate_update, ValidationErrorDetail
+import state
+
+# ensure data ready (cached so Streamlit reruns don't re-check the file)
+@st.cache_resource
+def _ensure_data_once():
+    ensure_cities_dataset()
+    return True
+
+_ensure_data_once()
+
+# restore the last world (newest snapshot + journal replay) once per
+# process, so updates journaled since the last checkpoint survive restarts
+@st.cache_resource
+def _recover_world_once():
+    if state.get_world() is None:
+        world = recover_latest_world()
+        if world is not None:
+            state.set_world(world)
+    return True
 
-# Start FastAPI server in background thread (uvicorn)
+_recover_world_once()
+
+# Optionally start FastAPI server in background thread (uvicorn) for external clients
 def start_api():
+    import importlib.util
+    import uvicorn
+    from api import app as fastapi_app
+    # uvloop's C event loop cuts per-wakeup overhead 2-4x over asyncio;
+    # fall back to the default loop where it isn't installed
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "auto"
+    http = "httptools" if importlib.util.find_spec("httptools") else "auto"
     # note: uses port 8000 (Streamlit Cloud may route differently; this typically works locally)
-    uvicorn.run(fastapi_app, host="127.0.0.1", port=8000, log_level="info")
+    uvicorn.run(fastapi_app, host="127.0.0.1", port=8000, loop=loop, http=http, log_level="info")
 
-if "api_thread" not in st.session_state:
+@st.cache_resource
+def _start_api_once():
     t = threading.Thread(target=start_api, daemon=True)
     t.start()
-    st.session_state["api_thread"] = t
-    # Give API a moment to start
-    time.sleep(0.5)
+    return t
+
+if os.environ.get("RUN_API"):
+    _start_api_once()
+
+@st.cache_data(ttl=5)
+def cached_snapshots():
+    return list_snapshots()
 
-API_BASE = "http://127.0.0.1:8000"
+def call_api(op, **kw):
+    """
+    Thin in-process shim mirroring the API endpoints. Returns the same
+    {"ok": ...} dicts the HTTP API does, without the loopback round-trip.
+    """
+    if op == "generate_world":
+        world = generate_world(**kw)
+        state.set_world(world)
+        cached_snapshots.clear()  # the initial snapshot just landed
+        return {"ok": True, "world": export_world(world)}
+    world = state.get_world()
+    if op == "suggest_event":
+        if not world:
+            return {"ok": False, "error": "No current world. Generate one first."}
+        return {"ok": True, "event": suggest_event(world)}
+    if op == "validate":
+        if not world:
+            return {"ok": False, "error": "No current world to validate against"}
+        try:
+            return {"ok": True, "result": validate_update(world, kw["update"])}
+        except ValidationErrorDetail as e:
+            return {"ok": False, "error": str(e), "details": getattr(e, "details", None)}
+    if op == "apply_update":
+        if not world:
+            return {"ok": False, "error": "No current world to apply updates"}
+        res = apply_update(world, kw["update"], snapshot=True)
+        if res.get("ok"):
+            state.set_world(res["world"])
+            cached_snapshots.clear()
+            return {"ok": True, "world": export_world(res["world"])}
+        return res
+    if op == "list_snapshots":
+        return {"ok": True, "snapshots": cached_snapshots()}
+    if op == "rollback":
+        try:
+            world = rollback_to(kw["snapshot_id"])
+        except FileNotFoundError:
+            return {"ok": False, "error": "Snapshot not found"}
+        state.set_world(world)
+        cached_snapshots.clear()  # rollback restarts the journal segment
+        return {"ok": True, "world": export_world(world)}
+    return {"ok": False, "error": "Unknown op: " + str(op)}
 
 st.title("Lightweight World Backend — Demo UI")
-st.markdown("This Streamlit UI starts a small FastAPI server in the background and provides basic controls.")
+st.markdown("This Streamlit UI calls the world engine directly and provides basic controls.")
 
 # Generate world
 st.header("World Generation")
@@ -42,24 +115,18 @@ cols = st.columns(3)
 regions_count = cols[0].number_input("Regions", min_value=1, max_value=12, value=4)
 cities_per_region = cols[1].number_input("Cities per region", min_value=1, max_value=12, value=3)
 if st.button("Generate world"):
-    resp = requests.post(f"{API_BASE}/generate/world", json={"name": name, "regions_count": int(regions_count), "cities_per_region": int(cities_per_region)})
-    st.write(resp.json())
+    st.write(call_api("generate_world", name=name, regions_count=int(regions_count), cities_per_region=int(cities_per_region)))
 
 # Show current world
 st.header("Current World")
-if st.button("Refresh world (from API)"):
-    try:
-        # No direct endpoint to fetch world; we rely on STREAM of endpoints - but we can attempt to generate world earlier.
-        # For demo: display the CURRENT_WORLD imported from api module (best-effort)
-        st.json(CURRENT_WORLD)
-    except Exception as e:
-        st.write("Unable to read current world:", e)
+if st.button("Refresh world"):
+    world = state.get_world()
+    st.json(export_world(world) if world else {})
 
 # Events
 st.header("Event generation")
 if st.button("Suggest an event"):
-    resp = requests.post(f"{API_BASE}/generate/event")
-    st.json(resp.json())
+    st.json(call_api("suggest_event"))
 
 # Apply update (basic)
 st.header("Apply update (validate then apply)")
@@ -72,8 +139,7 @@ if st.button("Validate update"):
         st.error("Invalid JSON: " + str(e))
         payload = None
     if payload:
-        resp = requests.post(f"{API_BASE}/validate", json=payload)
-        st.json(resp.json())
+        st.json(call_api("validate", update=payload))
 
 if st.button("Apply update now"):
     try:
@@ -82,14 +148,12 @@ if st.button("Apply update now"):
         st.error("Invalid JSON: " + str(e))
         payload = None
     if payload:
-        resp = requests.post(f"{API_BASE}/apply-update", json=payload)
-        st.json(resp.json())
+        st.json(call_api("apply_update", update=payload))
 
 # Snapshots / rollback
 st.header("Snapshots")
 if st.button("List snapshots"):
-    resp = requests.get(f"{API_BASE}/snapshots")
-    st.json(resp.json())
+    st.json(call_api("list_snapshots"))
 
 st.markdown("Rollback by snapshot id:")
 snap_id = st.text_input("Snapshot ID to rollback", "")
@@ -97,8 +161,7 @@ if st.button("Rollback"):
     if not snap_id:
         st.error("Enter snapshot id")
     else:
-        resp = requests.post(f"{API_BASE}/rollback", json={"snapshot_id": snap_id})
-        st.json(resp.json())
+        st.json(call_api("rollback", snapshot_id=snap_id))
 
 st.markdown("---")
 st.caption("This demo keeps state in memory and snapshots on disk (`data/snapshots`). Use the API endpoints directly for automation.")
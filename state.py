@@ -0,0 +1,19 @@
+# state.py
+"""
+Shared in-memory world state.
+Both the Streamlit UI (app.py) and the FastAPI app (api.py) go through
+this module so they always see the same world object. Use the accessors
+instead of importing CURRENT_WORLD directly — a `from state import
+CURRENT_WORLD` captures the binding at import time and goes stale.
+"""
+
+from typing import Dict, Any, Optional
+
+CURRENT_WORLD: Optional[Dict[str, Any]] = None
+
+def get_world() -> Optional[Dict[str, Any]]:
+    return CURRENT_WORLD
+
+def set_world(world: Dict[str, Any]) -> None:
+    global CURRENT_WORLD
+    CURRENT_WORLD = world
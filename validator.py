@@ -1,19 +1,104 @@
 # validator.py
 """
 Validate proposed updates before applying them.
-Checks both schema and simple logical constraints.
+Each operation is a pydantic v2 model in a discriminated union keyed on
+'op', so only the update itself is validated per request — O(|update|),
+not O(|world|). The current world reaches the models' logical checks
+through a ContextVar; full-world re-validation is opt-in via strict=.
 """
 
-from typing import Dict, Any, List
-from world_model import World, Region, City
-from pydantic import ValidationError
+from contextvars import ContextVar
+from typing import Annotated, Any, Dict, Literal, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, model_validator
+
+from world_model import World
 
 class ValidationErrorDetail(Exception):
     def __init__(self, message, details=None):
         super().__init__(message)
         self.details = details
 
-def validate_update(world_dict: Dict[str, Any], update_payload: Dict[str, Any]) -> Dict[str, Any]:
+# world the op models check against; set for the duration of validate_update
+_CURRENT_WORLD: ContextVar[Optional[Dict[str, Any]]] = ContextVar("_CURRENT_WORLD", default=None)
+
+def _world_lookups():
+    """(regions, cities) of the world under validation; accepts the legacy list shape."""
+    world = _CURRENT_WORLD.get() or {}
+    regions = world.get("regions", {})
+    if isinstance(regions, list):
+        regions = {r["name"]: r for r in regions}
+    return regions, world.get("cities", {})
+
+class AddCity(BaseModel):
+    op: Literal["add_city"]
+    region: str
+    city: Dict[str, Any]
+
+    @model_validator(mode="after")
+    def check_against_world(self):
+        regions, cities = _world_lookups()
+        if self.region not in regions:
+            raise ValidationErrorDetail(f"Region '{self.region}' does not exist")
+        if self.city.get("name") in cities:
+            raise ValidationErrorDetail(f"City '{self.city.get('name')}' already exists")
+        if self.city.get("population", 0) < 0:
+            raise ValidationErrorDetail("Population must be >= 0")
+        return self
+
+class AddResource(BaseModel):
+    op: Literal["add_resource"]
+    region: str
+    resource: str
+
+    @model_validator(mode="after")
+    def check_against_world(self):
+        regions, _ = _world_lookups()
+        if self.region not in regions:
+            raise ValidationErrorDetail(f"Region '{self.region}' does not exist")
+        # reject duplicates
+        if self.resource in regions[self.region].get("resources", []):
+            raise ValidationErrorDetail(f"Resource '{self.resource}' already present in region")
+        return self
+
+class TransferCity(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    op: Literal["transfer_city"]
+    city: str
+    from_region: str = Field(alias="from")
+    to_region: str = Field(alias="to")
+
+    @model_validator(mode="after")
+    def check_against_world(self):
+        regions, cities = _world_lookups()
+        if self.from_region not in regions or self.to_region not in regions:
+            raise ValidationErrorDetail("Invalid 'from' or 'to' region")
+        if self.city not in cities:
+            raise ValidationErrorDetail("City does not exist")
+        if self.city not in regions[self.from_region].get("cities", ()):
+            raise ValidationErrorDetail(f"City not found in region '{self.from_region}'")
+        return self
+
+class SetPopulation(BaseModel):
+    op: Literal["set_population"]
+    city: str
+    population: int = Field(ge=0, strict=True)
+
+    @model_validator(mode="after")
+    def check_against_world(self):
+        _, cities = _world_lookups()
+        if self.city not in cities:
+            raise ValidationErrorDetail("City does not exist")
+        return self
+
+UpdatePayload = Annotated[
+    Union[AddCity, AddResource, TransferCity, SetPopulation],
+    Field(discriminator="op"),
+]
+_UPDATE_ADAPTER: TypeAdapter = TypeAdapter(UpdatePayload)
+
+def validate_update(world_dict: Dict[str, Any], update_payload: Dict[str, Any], strict: bool = False) -> Dict[str, Any]:
     """
     Validate an update against the current world.
 
@@ -24,69 +109,29 @@ def validate_update(world_dict: Dict[str, Any], update_payload: Dict[str, Any])
     - {"op":"set_population", "city":"X", "population": 12345}
     - etc.
 
+    strict=True additionally re-validates the whole world dict (slow,
+    O(|world|)); the world was validated when it was created, so this is
+    off by default.
+
     Return: {"valid": True} or raise ValidationErrorDetail with message/details
     """
-    # Basic shape validation using World model
-    try:
-        _ = World.parse_obj(world_dict)
-    except ValidationError as e:
-        raise ValidationErrorDetail("Current world data is invalid", details=str(e))
+    if strict:
+        try:
+            _ = World.model_validate(world_dict)
+        except ValidationError as e:
+            raise ValidationErrorDetail("Current world data is invalid", details=str(e))
 
     op = update_payload.get("op")
     if not op:
         raise ValidationErrorDetail("Missing 'op' field in update")
 
-    # helper lookups
-    regions = {r["name"]: r for r in world_dict.get("regions", [])}
-    cities = world_dict.get("cities", {})
-
-    if op == "add_city":
-        region_name = update_payload.get("region")
-        city_obj = update_payload.get("city")
-        if not region_name or not city_obj:
-            raise ValidationErrorDetail("add_city requires 'region' and 'city' fields")
-        if region_name not in regions:
-            raise ValidationErrorDetail(f"Region '{region_name}' does not exist")
-        if city_obj.get("name") in cities:
-            raise ValidationErrorDetail(f"City '{city_obj.get('name')}' already exists")
-        if city_obj.get("population", 0) < 0:
-            raise ValidationErrorDetail("Population must be >= 0")
-        return {"valid": True}
-
-    if op == "add_resource":
-        region_name = update_payload.get("region")
-        resource = update_payload.get("resource")
-        if not region_name or not resource:
-            raise ValidationErrorDetail("add_resource requires 'region' and 'resource'")
-        if region_name not in regions:
-            raise ValidationErrorDetail(f"Region '{region_name}' does not exist")
-        # reject duplicates
-        if resource in regions[region_name].get("resources", []):
-            raise ValidationErrorDetail(f"Resource '{resource}' already present in region")
-        return {"valid": True}
-
-    if op == "transfer_city":
-        city = update_payload.get("city")
-        from_region = update_payload.get("from")
-        to_region = update_payload.get("to")
-        if not city or not from_region or not to_region:
-            raise ValidationErrorDetail("transfer_city requires 'city', 'from', 'to'")
-        if from_region not in regions or to_region not in regions:
-            raise ValidationErrorDetail("Invalid 'from' or 'to' region")
-        if city not in cities:
-            raise ValidationErrorDetail("City does not exist")
-        if city not in regions[from_region].get("cities", []):
-            raise ValidationErrorDetail(f"City not found in region '{from_region}'")
-        return {"valid": True}
-
-    if op == "set_population":
-        city = update_payload.get("city")
-        population = update_payload.get("population")
-        if city not in cities:
-            raise ValidationErrorDetail("City does not exist")
-        if not isinstance(population, int) or population < 0:
-            raise ValidationErrorDetail("Population must be a non-negative integer")
-        return {"valid": True}
-
-    # Unknown op => reject
-    raise ValidationErrorDetail("Unknown operation: " + str(op))
+    token = _CURRENT_WORLD.set(world_dict)
+    try:
+        _UPDATE_ADAPTER.validate_python(update_payload)
+    except ValidationError as e:
+        if any(err.get("type") == "union_tag_invalid" for err in e.errors()):
+            raise ValidationErrorDetail("Unknown operation: " + str(op))
+        raise ValidationErrorDetail("Invalid update payload", details=str(e))
+    finally:
+        _CURRENT_WORLD.reset(token)
+    return {"valid": True}
@@ -4,33 +4,49 @@ Core world engine: generate world, propose events, apply updates (after validati
 """
 
 from world_model import World, Region, City
-from typing import Dict, Any, List, Tuple
-from storage import create_snapshot
+from typing import Any, Callable, Dict, List, Tuple
+from storage import create_snapshot, record_update, load_snapshot, list_snapshots, journal_entries, now_iso
 from validator import validate_update, ValidationErrorDetail
-from datetime import datetime
+import functools
 import random
 import json
 from pathlib import Path
-import csv
+
+import numpy as np
+import pandas as pd
 
 DATA_DIR = Path("data")
 CITIES_CSV = DATA_DIR / "cities.csv"
 
-def _load_cities_csv() -> List[Tuple[str, str, int]]:
+def _load_cities_csv() -> Tuple[Tuple[str, str, int], ...]:
+    """
+    Return (city, region, population) rows from the cities CSV.
+    The CSV is immutable between restarts, so the parsed rows are
+    memoized; the stat key invalidates the cache if the file changes.
+    """
     if not CITIES_CSV.exists():
-        return []
-    rows = []
-    with open(CITIES_CSV, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            try:
-                name = r.get("city") or r.get("name") or r.get("City")
-                region = r.get("region") or r.get("country") or r.get("Region") or "Unknown"
-                pop = int(r.get("population") or 0)
-                rows.append((name, region, pop))
-            except Exception:
-                continue
-    return rows
+        return ()
+    st = CITIES_CSV.stat()
+    return _parse_cities_csv(st.st_mtime_ns, st.st_size)
+
+@functools.lru_cache(maxsize=1)
+def _parse_cities_csv(mtime_ns: int, size: int) -> Tuple[Tuple[str, str, int], ...]:
+    # pandas' C parser; column names vary between datasets, so resolve
+    # them case-insensitively as the old DictReader loop did
+    df = pd.read_csv(CITIES_CSV)
+    cols = {str(c).lower(): c for c in df.columns}
+    name_col = next((cols[c] for c in ("city", "name") if c in cols), None)
+    region_col = next((cols[c] for c in ("region", "country") if c in cols), None)
+    pop_col = cols.get("population")
+    if name_col is None:
+        return ()
+    out = pd.DataFrame({
+        "city": df[name_col].astype(str),
+        "region": df[region_col].fillna("Unknown").astype(str) if region_col is not None else "Unknown",
+        "population": pd.to_numeric(df[pop_col], errors="coerce").fillna(0).astype("int32")
+                      if pop_col is not None else 0,
+    })
+    return tuple(out.itertuples(index=False, name=None))
 
 def generate_world(name: str = "MyWorld", regions_count: int = 4, cities_per_region: int = 3) -> Dict[str, Any]:
     """
@@ -43,6 +59,19 @@ def generate_world(name: str = "MyWorld", regions_count: int = 4, cities_per_reg
 
     regions: Dict[str, Dict] = {}
     cities: Dict[str, Dict] = {}
+    city_to_region: Dict[str, str] = {}
+
+    # All random draws happen vectorized up front: one call for every
+    # population and one matrix for per-region resource picks, instead
+    # of a Python-level random call per city/region.
+    rng = np.random.default_rng()
+    res_k = min(2, len(resource_pool))
+
+    def _resource_picks(count: int) -> List[List[str]]:
+        # distinct resources per region: argsort of uniform noise gives
+        # `count` independent permutations in one shot
+        idx = np.argsort(rng.random((count, len(resource_pool))), axis=1)[:, :res_k]
+        return [[resource_pool[j] for j in row] for row in idx]
 
     # If CSV exists, use its region names; else create synthetic regions
     if cities_rows:
@@ -51,15 +80,16 @@ def generate_world(name: str = "MyWorld", regions_count: int = 4, cities_per_reg
         for name, region, pop in cities_rows:
             by_region.setdefault(region, []).append((name, pop))
         region_names = list(by_region.keys())
-        random.shuffle(region_names)
+        rng.shuffle(region_names)
         selected_regions = region_names[:regions_count] if region_names else [f"Region{i}" for i in range(regions_count)]
-        for region in selected_regions:
+        region_resources = _resource_picks(len(selected_regions))
+        # fallback populations for CSV rows that lack one
+        fallback_pops = iter(rng.integers(1000, 20001, size=len(selected_regions) * cities_per_region).tolist())
+        for region, res in zip(selected_regions, region_resources):
             regs_cities = by_region.get(region, [])[:cities_per_region]
-            # create region entry
-            res = random.sample(resource_pool, k=min(2, len(resource_pool)))
             regions[region] = {
                 "name": region,
-                "cities": [],
+                "cities": set(),
                 "resources": res
             }
             for name, pop in regs_cities:
@@ -68,69 +98,205 @@ def generate_world(name: str = "MyWorld", regions_count: int = 4, cities_per_reg
                 idx = 1
                 while key in cities:
                     key = f"{name}_{idx}"; idx += 1
-                city_obj = {"name": key, "population": pop or random.randint(1000, 20000), "attributes": {}}
+                city_obj = {"name": key, "population": pop or next(fallback_pops), "attributes": {}}
                 cities[key] = city_obj
-                regions[region]["cities"].append(key)
+                regions[region]["cities"].add(key)
+                city_to_region[key] = region
     else:
         # Synthetic creation
+        region_resources = _resource_picks(regions_count)
+        pops = iter(rng.integers(500, 50001, size=regions_count * cities_per_region).tolist())
         for i in range(regions_count):
             rname = f"Region_{i+1}"
             regions[rname] = {
                 "name": rname,
-                "cities": [],
-                "resources": random.sample(resource_pool, k=2)
+                "cities": set(),
+                "resources": region_resources[i]
             }
             for j in range(cities_per_region):
                 cname = f"City_{i+1}_{j+1}"
-                city_obj = {"name": cname, "population": random.randint(500, 50000), "attributes": {}}
+                city_obj = {"name": cname, "population": next(pops), "attributes": {}}
                 cities[cname] = city_obj
-                regions[rname]["cities"].append(cname)
+                regions[rname]["cities"].add(cname)
+                city_to_region[cname] = rname
 
+    created_at = now_iso()
     world = {
         "name": name,
-        "regions": list(regions.values()),
+        "regions": regions,
         "cities": cities,
-        "metadata": {"generated_at": datetime.utcnow().isoformat() + "Z"},
-        "created_at": datetime.utcnow().isoformat() + "Z"
+        "city_to_region": city_to_region,
+        "metadata": {"generated_at": created_at},
+        "created_at": created_at
     }
     # Save initial snapshot
     snap_id = create_snapshot(world, tag=f"initial-{name}")
     world["metadata"]["initial_snapshot"] = snap_id
     return world
 
+def _regions_dict(world: Dict[str, Any]) -> Dict[str, Dict]:
+    """Regions keyed by name; migrates legacy/deserialized snapshot shapes in place."""
+    regions = world.get("regions", {})
+    if isinstance(regions, list):
+        regions = {r["name"]: r for r in regions}
+        world["regions"] = regions
+    # membership is set-backed with a city->region reverse index; snapshots
+    # store lists, so convert once after a (re)load
+    sample = next(iter(regions.values()), None)
+    if (sample is not None and not isinstance(sample.get("cities"), set)) or "city_to_region" not in world:
+        index: Dict[str, str] = {}
+        for rname, r in regions.items():
+            r["cities"] = set(r.get("cities", ()))
+            for c in r["cities"]:
+                index[c] = rname
+        world["city_to_region"] = index
+    return regions
+
+def export_world(world: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-safe view of the world: set-backed city memberships become sorted
+    lists and engine-private underscore keys are dropped."""
+    regions = _regions_dict(world)
+    out = {k: v for k, v in world.items() if not k.startswith("_")}
+    out["regions"] = {name: {**r, "cities": sorted(r.get("cities", ()))} for name, r in regions.items()}
+    return out
+
+def _names_cache(world: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """
+    (city_names, region_names) memoized on the world itself; apply_update
+    bumps world['_version'] so the lists are rebuilt only after a mutation.
+    """
+    regions = _regions_dict(world)
+    version = world.get("_version", 0)
+    cache = world.get("_cache")
+    if cache is None or cache["version"] != version:
+        cache = {
+            "version": version,
+            "city_names": list(world.get("cities", {})),
+            "region_names": list(regions),
+        }
+        world["_cache"] = cache
+    return cache["city_names"], cache["region_names"]
+
+# Event templates as plain module-level functions: no lambda closures or
+# template list are allocated per call. Draws use a per-process Random
+# instance instead of the shared module-global state.
+_RNG = random.Random()
+_EVENT_RESOURCES = ("coal", "gold", "salt", "spice")
+
+def _tpl_discover_resource(city_names: List[str], region_names: List[str]) -> Dict[str, Any]:
+    return {
+        "type": "discover_resource",
+        "text": f"City {_RNG.choice(city_names)} discovers a deposit of {_RNG.choice(_EVENT_RESOURCES)}."
+    }
+
+def _tpl_drought(city_names: List[str], region_names: List[str]) -> Dict[str, Any]:
+    return {
+        "type": "drought",
+        "text": f"Region {_RNG.choice(region_names)} suffers a drought."
+    }
+
+def _tpl_trade_route(city_names: List[str], region_names: List[str]) -> Dict[str, Any]:
+    a, b = _RNG.choices(region_names, k=2)
+    return {
+        "type": "trade_route",
+        "text": f"Trade route opens between {a} and {b}."
+    }
+
+def _tpl_population_boost(city_names: List[str], region_names: List[str]) -> Dict[str, Any]:
+    return {
+        "type": "population_boost",
+        "text": f"City {_RNG.choice(city_names)} experiences an unexpected population growth."
+    }
+
+_TEMPLATES = (_tpl_discover_resource, _tpl_drought, _tpl_trade_route, _tpl_population_boost)
+
 def suggest_event(world: Dict[str, Any]) -> Dict[str, Any]:
     """
     Propose a lightweight event based on current world state.
     Picks from a few templates using simple heuristics.
     """
-    regions = world.get("regions", [])
-    cities = world.get("cities", {})
-    if not regions:
+    city_names, region_names = _names_cache(world)
+    if not region_names:
         return {"event": "No regions to generate events for."}
 
-    templates = [
-        lambda: {
-            "type": "discover_resource",
-            "text": f"City {random.choice(list(cities.keys()))} discovers a deposit of {random.choice(['coal','gold','salt','spice'])}."
-        },
-        lambda: {
-            "type": "drought",
-            "text": f"Region {random.choice([r['name'] for r in regions])} suffers a drought."
-        },
-        lambda: {
-            "type": "trade_route",
-            "text": f"Trade route opens between {random.choice([r['name'] for r in regions])} and {random.choice([r['name'] for r in regions])}."
-        },
-        lambda: {
-            "type": "population_boost",
-            "text": f"City {random.choice(list(cities.keys()))} experiences an unexpected population growth."
-        }
-    ]
-    # weighted pick
-    event = random.choice(templates)()
-    event["timestamp"] = datetime.utcnow().isoformat() + "Z"
+    event = _TEMPLATES[_RNG.randrange(len(_TEMPLATES))](city_names, region_names)
+    event["timestamp"] = now_iso()
     return event
 
+def recover_latest_world() -> Dict[str, Any] | None:
+    """
+    Rebuild the most recent world state from disk. Journal entries name
+    the checkpoint they apply on top of, so that snapshot is the base —
+    not simply the newest one, which after a rollback would resurrect
+    the rolled-back state. With an empty journal the newest readable
+    checkpoint wins; unreadable files (e.g. a queued write that never
+    completed) are skipped.
+    """
+    entries = journal_entries()
+    base_id = entries[0].get("checkpoint") if entries else None
+    world = None
+    if base_id:
+        try:
+            world = load_snapshot(base_id)
+        except (FileNotFoundError, ValueError, KeyError):
+            # the journal's base is gone/unreadable; its entries can't
+            # be applied to any other snapshot, so drop them
+            entries = []
+    if world is None:
+        for snap in list_snapshots():
+            try:
+                world = load_snapshot(snap["id"])
+                break
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+    if world is None:
+        return None
+    for entry in entries:
+        res = apply_update(world, entry.get("payload", {}), snapshot=False)
+        if res.get("ok"):
+            world = res["world"]
+    return world
+
+# Per-op mutation handlers; each takes (world, regions, payload) and
+# returns the snapshot tag for the journal. The validator has already
+# checked region/city existence by the time these run.
+def _apply_add_city(world: Dict[str, Any], regions: Dict[str, Dict], payload: Dict[str, Any]) -> str:
+    region_name = payload["region"]
+    city = payload["city"]
+    world["cities"][city["name"]] = city
+    regions[region_name].setdefault("cities", set()).add(city["name"])
+    world["city_to_region"][city["name"]] = region_name
+    return f"add_city:{city['name']}"
+
+def _apply_add_resource(world: Dict[str, Any], regions: Dict[str, Dict], payload: Dict[str, Any]) -> str:
+    region_name = payload["region"]
+    resource = payload["resource"]
+    regions[region_name].setdefault("resources", []).append(resource)
+    return f"add_resource:{resource}@{region_name}"
+
+def _apply_transfer_city(world: Dict[str, Any], regions: Dict[str, Dict], payload: Dict[str, Any]) -> str:
+    city = payload["city"]
+    from_region = payload["from"]
+    to_region = payload["to"]
+    # remove from from_region, add to to_region
+    regions[from_region].setdefault("cities", set()).discard(city)
+    regions[to_region].setdefault("cities", set()).add(city)
+    world["city_to_region"][city] = to_region
+    return f"transfer_city:{city}:{from_region}->{to_region}"
+
+def _apply_set_population(world: Dict[str, Any], regions: Dict[str, Dict], payload: Dict[str, Any]) -> str:
+    city = payload["city"]
+    population = payload["population"]
+    world["cities"][city]["population"] = population
+    return f"set_pop:{city}:{population}"
+
+HANDLERS: Dict[str, Callable[[Dict[str, Any], Dict[str, Dict], Dict[str, Any]], str]] = {
+    "add_city": _apply_add_city,
+    "add_resource": _apply_add_resource,
+    "transfer_city": _apply_transfer_city,
+    "set_population": _apply_set_population,
+}
+
 def apply_update(world: Dict[str, Any], update_payload: Dict[str, Any], snapshot: bool = True) -> Dict[str, Any]:
     """
     Validate and apply update_payload to world. Returns updated world.
@@ -142,56 +308,12 @@ def apply_update(world: Dict[str, Any], update_payload: Dict[str, Any], snapshot
     except ValidationErrorDetail as e:
         return {"ok": False, "error": str(e), "details": getattr(e, "details", None)}
 
-    op = update_payload.get("op")
-    if op == "add_city":
-        region_name = update_payload["region"]
-        city = update_payload["city"]
-        # add city
-        world["cities"][city["name"]] = city
-        # append to region
-        for r in world["regions"]:
-            if r["name"] == region_name:
-                r.setdefault("cities", []).append(city["name"])
-                break
-        # snapshot
-        if snapshot:
-            create_snapshot(world, tag=f"add_city:{city['name']}")
-        return {"ok": True, "world": world}
-
-    if op == "add_resource":
-        region_name = update_payload["region"]
-        resource = update_payload["resource"]
-        for r in world["regions"]:
-            if r["name"] == region_name:
-                r.setdefault("resources", []).append(resource)
-                break
-        if snapshot:
-            create_snapshot(world, tag=f"add_resource:{resource}@{region_name}")
-        return {"ok": True, "world": world}
-
-    if op == "transfer_city":
-        city = update_payload["city"]
-        from_region = update_payload["from"]
-        to_region = update_payload["to"]
-        # remove from from_region, add to to_region
-        for r in world["regions"]:
-            if r["name"] == from_region and city in r.get("cities", []):
-                r["cities"].remove(city)
-        for r in world["regions"]:
-            if r["name"] == to_region:
-                r.setdefault("cities", []).append(city)
-        if snapshot:
-            create_snapshot(world, tag=f"transfer_city:{city}:{from_region}->{to_region}")
-        return {"ok": True, "world": world}
-
-    if op == "set_population":
-        city = update_payload["city"]
-        population = update_payload["population"]
-        if city in world["cities"]:
-            world["cities"][city]["population"] = population
-            if snapshot:
-                create_snapshot(world, tag=f"set_pop:{city}:{population}")
-            return {"ok": True, "world": world}
-
-    # fallback
-    return {"ok": False, "error": "Unsupported op after validation (unexpected)"}
+    handler = HANDLERS.get(update_payload.get("op"))
+    if handler is None:
+        return {"ok": False, "error": "Unsupported op after validation (unexpected)"}
+    tag = handler(world, _regions_dict(world), update_payload)
+    world["_version"] = world.get("_version", 0) + 1  # invalidate the names cache
+    # journal (checkpoint snapshot every N ops)
+    if snapshot:
+        record_update(world, update_payload, tag=tag)
+    return {"ok": True, "world": world}
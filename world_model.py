@@ -1,30 +1,45 @@
 # world_model.py
 """
-Pydantic models for the world. Small, explicit, easy to validate.
+Pydantic v2 models for the world. Small, explicit, easy to validate.
 """
 
-from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import List, Optional, Dict, Any, Set
 from datetime import datetime
 
 class City(BaseModel):
+    # frozen: validated instances are read-only views; mutation happens on
+    # the plain world dicts in the engine. None instead of an empty dict
+    # skips an allocation for the many cities without attributes.
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     name: str
     population: int = Field(ge=0)
-    attributes: Dict[str, Any] = Field(default_factory=dict)  # e.g. {"harbor": True}
+    attributes: Optional[Dict[str, Any]] = None  # e.g. {"harbor": True}
 
 class Region(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     name: str
-    cities: List[str] = Field(default_factory=list)   # store city names (normalized)
+    cities: Set[str] = Field(default_factory=set)     # city names; serialized as sorted lists
     resources: List[str] = Field(default_factory=list)
 
 class World(BaseModel):
+    # extra keys are ignored (not forbidden): live worlds carry
+    # engine-private underscore fields that validation shouldn't reject
+    model_config = ConfigDict(frozen=True)
+
     name: str
-    regions: List[Region] = Field(default_factory=list)
+    regions: Dict[str, Region] = Field(default_factory=dict)  # keyed by region name
     cities: Dict[str, City] = Field(default_factory=dict)  # keyed by city name
+    city_to_region: Dict[str, str] = Field(default_factory=dict)  # reverse index, maintained by the engine
     metadata: Dict[str, Any] = Field(default_factory=dict)
     created_at: Optional[datetime] = None
 
-    @validator("cities", pre=True)
-    def ensure_city_keys(cls, v):
-        # pydantic will ensure dict shape; no-op here
+    @field_validator("regions", mode="before")
+    @classmethod
+    def ensure_region_keys(cls, v):
+        # migrate the legacy list-of-regions shape (old snapshots)
+        if isinstance(v, list):
+            return {r["name"] if isinstance(r, dict) else r.name: r for r in v}
         return v